@@ -12,6 +12,21 @@ DOMAIN = "jackery_home"
 PLATFORMS = [Platform.SENSOR]
 
 
+def parse_sub_devices(raw: str) -> list[str]:
+    """Parse the comma-separated sub_devices option into unique dev_sn values."""
+    sub_devices = {}  # {dev_sn 小写: 首次出现的写法}
+    for dev_sn in (raw or "").split(","):
+        dev_sn = dev_sn.strip()
+        if not dev_sn:
+            continue
+        # ems_ 前缀为网关自身设备，不能作为子设备
+        if dev_sn.lower().startswith("ems_"):
+            _LOGGER.warning(f"Ignoring gateway EMS serial in sub_devices: {dev_sn}")
+            continue
+        sub_devices.setdefault(dev_sn.lower(), dev_sn)
+    return list(sub_devices.values())
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up JackeryHome from a config entry."""
     _LOGGER.info("Setting up JackeryHome integration")
@@ -36,10 +51,18 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     
     # 加载传感器平台
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
-    
+
+    # 选项（如子设备列表）变更后重新加载集成
+    entry.async_on_unload(entry.add_update_listener(_async_update_listener))
+
     return True
 
 
+async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload JackeryHome when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     _LOGGER.info("Unloading JackeryHome integration")
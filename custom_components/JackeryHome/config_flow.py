@@ -5,14 +5,24 @@ from typing import Any
 import voluptuous as vol
 
 from homeassistant import config_entries
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.components import mqtt
 
-from . import DOMAIN
+from . import DOMAIN, parse_sub_devices
 
 _LOGGER = logging.getLogger(__name__)
 
+
+def _validate_sub_devices(user_input: dict[str, Any], errors: dict[str, str]) -> None:
+    """校验并规范化 sub_devices（去重、拒绝 ems_ 开头的网关序列号）."""
+    raw = user_input.get("sub_devices", "")
+    if any(sn.strip().lower().startswith("ems_") for sn in raw.split(",")):
+        errors["sub_devices"] = "invalid_sub_device"
+    else:
+        user_input["sub_devices"] = ",".join(parse_sub_devices(raw))
+
+
 # 配置数据模式
 DATA_SCHEMA = vol.Schema(
     {
@@ -20,6 +30,7 @@ DATA_SCHEMA = vol.Schema(
             "topic_prefix",
             default="homeassistant/sensor"
         ): str,
+        vol.Optional("sub_devices", default=""): str,
     }
 )
 
@@ -39,10 +50,11 @@ class JackeryHomeConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         errors = {}
 
         if user_input is not None:
+            _validate_sub_devices(user_input, errors)
             # 检查 MQTT 集成是否已配置
             if not await mqtt.async_wait_for_mqtt_client(self.hass):
                 errors["base"] = "mqtt_not_configured"
-            else:
+            elif not errors:
                 _LOGGER.info(
                     f"Creating JackeryHome config entry with topic_prefix: "
                     f"{user_input.get('topic_prefix', 'homeassistant/sensor')}"
@@ -59,6 +71,7 @@ class JackeryHomeConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             errors=errors,
             description_placeholders={
                 "topic_prefix": "MQTT topic prefix (e.g., homeassistant/sensor)",
+                "sub_devices": "Comma-separated sub-device dev_sn list (optional)",
             },
         )
 
@@ -66,3 +79,46 @@ class JackeryHomeConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         """Import a config entry from configuration.yaml."""
         return await self.async_step_user(import_config)
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(
+        config_entry: config_entries.ConfigEntry,
+    ) -> config_entries.OptionsFlow:
+        """Get the options flow for this handler."""
+        return JackeryHomeOptionsFlow(config_entry)
+
+
+class JackeryHomeOptionsFlow(config_entries.OptionsFlow):
+    """Handle JackeryHome options (sub-devices)."""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        """Initialize options flow."""
+        self._entry = config_entry
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage the sub-device list."""
+        errors = {}
+
+        if user_input is not None:
+            _validate_sub_devices(user_input, errors)
+            if not errors:
+                # 保存后由 __init__.py 中的更新监听器重新加载集成
+                return self.async_create_entry(title="", data=user_input)
+
+        # options 优先于初始配置中的值
+        current = {**self._entry.data, **self._entry.options}
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        "sub_devices",
+                        default=current.get("sub_devices", ""),
+                    ): str,
+                }
+            ),
+            errors=errors,
+        )
+
@@ -17,7 +17,7 @@ from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.const import UnitOfPower, UnitOfEnergy, PERCENTAGE
 
-from . import DOMAIN
+from . import DOMAIN, parse_sub_devices
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -43,6 +43,19 @@ METER_SN_MAP = {
     "battery_discharge_power": "16931841",
 }
 
+# 子设备（如扩展电池包）的 Meter SN 映射，传感器配置复用 SENSORS
+# 注意：这些 meter_sn 是假设子设备与 EMS 汇总值使用相同编码，尚未在真实电池包上验证
+SUB_DEVICE_METER_SN_MAP = {
+    sensor_id: METER_SN_MAP[sensor_id]
+    for sensor_id in (
+        "battery_soc",
+        "battery_charge_power",
+        "battery_discharge_power",
+        "battery_charge_energy",
+        "battery_discharge_energy",
+    )
+}
+
 # 传感器配置
 SENSORS = {
     "eps_power": {
@@ -173,10 +186,40 @@ class JackeryDataCoordinator:
         self._data_get_topic = "v1/iot_gw/cloud/data"  # 发送数据请求的主题
         self._gw_lwt_topic = "v1/iot_gw/gw_lwt"  # LWT 主题
         self._device_sn = ""  # 默认设备序列号
-        self._sensors = {}  # 存储所有传感器实体的引用 {sensor_id: entity}
+        self._sensors = {}  # 存储所有传感器实体的引用 {unique_id: entity}
+        self._sub_devices = {}  # 已配置的子设备 {dev_sn 小写: dev_sn}
         self._data_task = None  # 定时数据请求任务
+        self._unsubscribers = []  # MQTT 订阅的取消回调
         self._subscribed = False  # 标记是否已订阅
 
+    @property
+    def ems_dev_sn(self) -> str:
+        """网关自身 EMS 设备的 dev_sn."""
+        return f"ems_{self._device_sn}" if self._device_sn else "ems_"
+
+    def add_sub_device(self, dev_sn: str) -> None:
+        """登记已配置的子设备，使其包含在 data_get 请求中."""
+        self._sub_devices[dev_sn.lower()] = dev_sn
+        _LOGGER.info(f"Added sub-device {dev_sn} to coordinator")
+
+    def _is_gateway_sn(self, sn: Any) -> bool:
+        """判断序列号是否为当前网关（不区分大小写）."""
+        return str(sn).lower() == str(self._device_sn).lower()
+
+    def _resolve_dev_sn(self, dev_sn: str | None) -> str | None:
+        """将响应中的 dev_sn 映射为 EMS 设备或已配置的子设备，未请求的设备返回 None."""
+        # 未携带 dev_sn、ems_<gw_sn> 或 <gw_sn> 均视为网关自身的 EMS 设备
+        if not dev_sn:
+            return self.ems_dev_sn
+        key = str(dev_sn).lower()
+        if key.startswith("ems_") and (
+            not self._device_sn or self._is_gateway_sn(key[len("ems_"):])
+        ):
+            return self.ems_dev_sn
+        if self._device_sn and self._is_gateway_sn(key):
+            return self.ems_dev_sn
+        return self._sub_devices.get(key)
+
     def register_sensor(self, sensor_id: str, entity: "JackeryHomeSensor") -> None:
         """注册传感器实体到协调器."""
         self._sensors[sensor_id] = entity
@@ -200,12 +243,13 @@ class JackeryDataCoordinator:
                 """处理 LWT 消息."""
                 self._handle_lwt_message(msg)
             
-            await ha_mqtt.async_subscribe(
+            unsubscribe = await ha_mqtt.async_subscribe(
                 self.hass,
                 self._gw_lwt_topic,
                 lwt_message_received,
                 1
             )
+            self._unsubscribers.append(unsubscribe)
             _LOGGER.info(f"Coordinator subscribed to LWT topic: {self._gw_lwt_topic}")
             
             # 订阅数据响应 topic
@@ -214,12 +258,13 @@ class JackeryDataCoordinator:
                 """处理数据响应消息."""
                 self._handle_data_message(msg)
             
-            await ha_mqtt.async_subscribe(
+            unsubscribe = await ha_mqtt.async_subscribe(
                 self.hass,
                 self._data_topic,
                 data_message_received,
                 1
             )
+            self._unsubscribers.append(unsubscribe)
             _LOGGER.info(f"Coordinator subscribed to data topic: {self._data_topic}")
             
             self._subscribed = True
@@ -234,13 +279,19 @@ class JackeryDataCoordinator:
             )
 
     async def async_stop(self) -> None:
-        """停止协调器：取消定时任务."""
+        """停止协调器：取消定时任务并取消 MQTT 订阅."""
         if self._data_task and not self._data_task.done():
             self._data_task.cancel()
             try:
                 await self._data_task
             except asyncio.CancelledError:
                 pass
+
+        # 取消订阅，避免重新加载后旧协调器继续处理消息
+        for unsubscribe in self._unsubscribers:
+            unsubscribe()
+        self._unsubscribers.clear()
+        self._subscribed = False
         _LOGGER.info("Coordinator stopped")
 
     def _handle_lwt_message(self, msg) -> None:
@@ -285,11 +336,21 @@ class JackeryDataCoordinator:
     def _parse_and_distribute_data(self, data: dict) -> None:
         """解析 data_get 响应并分发给对应的传感器."""
         try:
+            # 数据主题为多个网关共用，忽略其他网关的响应
+            gw_sn = data.get("gw_sn")
+            if gw_sn and self._device_sn and not self._is_gateway_sn(gw_sn):
+                _LOGGER.debug(f"Ignoring data_get response from gateway {gw_sn}")
+                return
+
             info = data.get("info", {})
             dev_list = info.get("dev_list", [])
             
             # 遍历所有设备和meter
             for dev in dev_list:
+                dev_sn = self._resolve_dev_sn(dev.get("dev_sn"))
+                if dev_sn is None:
+                    _LOGGER.debug(f"Ignoring unrequested device: {dev.get('dev_sn')}")
+                    continue
                 meter_list = dev.get("meter_list", [])
                 for meter in meter_list:
                     # 响应格式：meter 是 [meter_sn, meter_value]
@@ -309,29 +370,36 @@ class JackeryDataCoordinator:
                         _LOGGER.debug(f"Invalid meter value: {meter[1]}")
                         continue
                     
-                    # 根据 meter_sn 找到对应的传感器并更新
-                    self._update_sensors_by_meter_sn(meter_sn, meter_value)
-                    
+                    # 按 (dev_sn, meter_sn) 找到对应的传感器并更新
+                    self._update_sensors_by_key(dev_sn, meter_sn, meter_value)
+
         except Exception as e:
             _LOGGER.error(f"Error parsing and distributing data: {e}")
 
-    def _update_sensors_by_meter_sn(self, meter_sn: str, meter_value: float) -> None:
-        """根据 meter_sn 更新对应的传感器."""
-        # 遍历所有传感器，找到匹配的 meter_sn
-        for sensor_id, entity in self._sensors.items():
-            if str(entity._meter_sn) == meter_sn:
-              
+    def _update_sensors_by_key(
+        self, dev_sn: str, meter_sn: str, meter_value: float
+    ) -> None:
+        """根据 (dev_sn, meter_sn) 更新对应的传感器."""
+        # 遍历所有传感器，找到匹配的设备和 meter_sn
+        for entity in self._sensors.values():
+            if entity.dev_sn == dev_sn and str(entity._meter_sn) == meter_sn:
                 processed_value = entity._process_meter_value(meter_value)
                 entity._update_sensor_value(processed_value)
 
     def _construct_data_get_request(self) -> dict:
-        """构造 data_get 请求，包含所有传感器的 meter_sn."""
-        # 收集所有唯一的 meter_sn
-        meter_sns = set()
+        """构造 data_get 请求，按设备分组包含所有传感器的 meter_sn."""
+        # 收集每个设备唯一的 meter_sn，网关 EMS 设备排在首位
+        dev_meters = {self.ems_dev_sn: set()}
+        for dev_sn in sorted(self._sub_devices.values()):
+            # 与网关自身序列号相同的子设备会被解析为 EMS 设备，不单独请求
+            if self._is_gateway_sn(dev_sn):
+                _LOGGER.debug(f"Sub-device {dev_sn} is the gateway itself, skipping")
+                continue
+            dev_meters[dev_sn] = set()
         for entity in self._sensors.values():
-            if entity._meter_sn:
-                meter_sns.add(entity._meter_sn)
-        
+            if entity._meter_sn and entity.dev_sn in dev_meters:
+                dev_meters[entity.dev_sn].add(entity._meter_sn)
+
         return {
             "cmd": "data_get",
             "gw_sn": self._device_sn or "",
@@ -340,9 +408,11 @@ class JackeryDataCoordinator:
             "info": {
                 "dev_list": [
                     {
-                        "dev_sn": f"ems_{self._device_sn}" if self._device_sn else "ems_",
+                        "dev_sn": dev_sn,
                         "meter_list": list(meter_sns),  # 一次性请求所有 meter_sn
                     }
+                    for dev_sn, meter_sns in dev_meters.items()
+                    if meter_sns
                 ]
             }
         }
@@ -403,8 +473,8 @@ async def async_setup_entry(
     """Set up JackeryHome sensors from a config entry."""
     _LOGGER.info("Setting up JackeryHome sensors")
     
-    # 获取配置数据
-    config = config_entry.data
+    # 获取配置数据（options 覆盖初始配置）
+    config = {**config_entry.data, **config_entry.options}
     topic_prefix = config.get("topic_prefix", "homeassistant/sensor")
     
     _LOGGER.info(f"Topic prefix: {topic_prefix}")
@@ -416,30 +486,53 @@ async def async_setup_entry(
     hass.data[DOMAIN][config_entry.entry_id]["coordinator"] = coordinator
     
     # 创建所有传感器实体
-    entities = []
-    for sensor_id, sensor_config in SENSORS.items():
-        entity = JackeryHomeSensor(
-            sensor_id=sensor_id,
-            name=sensor_config["name"],
-            unit=sensor_config["unit"],
-            icon=sensor_config["icon"],
-            device_class=sensor_config["device_class"],
-            state_class=sensor_config["state_class"],
-            topic_prefix=topic_prefix,
-            config_entry_id=config_entry.entry_id,
-            coordinator=coordinator,  # 传入协调器
+    entities = [
+        _create_sensor(sensor_id, topic_prefix, config_entry.entry_id, coordinator)
+        for sensor_id in SENSORS
+    ]
+
+    # 配置中指定的子设备（已去重），仅为这些设备请求数据并创建实体
+    for dev_sn in parse_sub_devices(config.get("sub_devices", "")):
+        coordinator.add_sub_device(dev_sn)
+        entities.extend(
+            _create_sensor(
+                sensor_id, topic_prefix, config_entry.entry_id, coordinator, dev_sn
+            )
+            for sensor_id in SUB_DEVICE_METER_SN_MAP
         )
-        entities.append(entity)
-    
+
     # 添加实体
     async_add_entities(entities)
-    
+
     # 启动协调器（在所有传感器添加后）
     await coordinator.async_start()
     
     _LOGGER.info(f"Added {len(entities)} JackeryHome sensors with shared coordinator")
 
 
+def _create_sensor(
+    sensor_id: str,
+    topic_prefix: str,
+    config_entry_id: str,
+    coordinator: JackeryDataCoordinator,
+    dev_sn: str | None = None,
+) -> "JackeryHomeSensor":
+    """根据 SENSORS 配置创建传感器实体，dev_sn 为空时属于网关 EMS 设备."""
+    sensor_config = SENSORS[sensor_id]
+    return JackeryHomeSensor(
+        sensor_id=sensor_id,
+        name=sensor_config["name"],
+        unit=sensor_config["unit"],
+        icon=sensor_config["icon"],
+        device_class=sensor_config["device_class"],
+        state_class=sensor_config["state_class"],
+        topic_prefix=topic_prefix,
+        config_entry_id=config_entry_id,
+        coordinator=coordinator,  # 传入协调器
+        dev_sn=dev_sn,
+    )
+
+
 class JackeryHomeSensor(SensorEntity):
     """Representation of a JackeryHome Sensor."""
 
@@ -454,9 +547,11 @@ class JackeryHomeSensor(SensorEntity):
         topic_prefix: str,
         config_entry_id: str,
         coordinator: JackeryDataCoordinator,
+        dev_sn: str | None = None,
     ) -> None:
         """Initialize the sensor."""
         self._sensor_id = sensor_id
+        self._dev_sn = dev_sn  # 子设备 dev_sn，None 表示网关 EMS 设备
         self._attr_name = name
         self._attr_native_unit_of_measurement = unit
         self._attr_icon = icon
@@ -470,6 +565,17 @@ class JackeryHomeSensor(SensorEntity):
             "model": "Energy Monitor",
             "sw_version": "1.0.5",
         }
+        if dev_sn:
+            # 子设备实体挂在独立设备下，并通过网关设备关联
+            self._attr_name = f"{name} {dev_sn}"
+            self._attr_unique_id = f"jackery_home_{dev_sn}_{sensor_id}"
+            self._attr_device_info = {
+                "identifiers": {(DOMAIN, f"{config_entry_id}_{dev_sn}")},
+                "name": f"JackeryHome {dev_sn}",
+                "manufacturer": "Jackery",
+                "model": "Sub Device",
+                "via_device": (DOMAIN, config_entry_id),
+            }
         self._attr_native_value = None
         self._attr_available = False
         self._attr_should_poll = False
@@ -477,7 +583,13 @@ class JackeryHomeSensor(SensorEntity):
         self._coordinator = coordinator  # 协调器引用
 
         # 获取 meter_sn，直接根据传感器 ID（包括 *_power 后缀）映射
-        self._meter_sn = METER_SN_MAP.get(sensor_id, 0)
+        meter_sn_map = SUB_DEVICE_METER_SN_MAP if dev_sn else METER_SN_MAP
+        self._meter_sn = meter_sn_map.get(sensor_id, 0)
+
+    @property
+    def dev_sn(self) -> str:
+        """传感器所属设备的 dev_sn."""
+        return self._dev_sn or self._coordinator.ems_dev_sn
 
     @property
     def should_poll(self) -> bool:
@@ -507,21 +619,21 @@ class JackeryHomeSensor(SensorEntity):
         self._attr_native_value = value
         self._attr_available = True
         self.async_write_ha_state()
-        _LOGGER.debug(f"Updated {self._sensor_id} with value: {value}")
+        _LOGGER.debug(f"Updated {self.unique_id} with value: {value}")
 
     async def async_added_to_hass(self) -> None:
         """传感器添加到 Home Assistant 时，注册到协调器."""
         await super().async_added_to_hass()
         
         # 注册到协调器
-        self._coordinator.register_sensor(self._sensor_id, self)
-        _LOGGER.info(f"JackeryHome sensor {self._sensor_id} registered to coordinator")
+        self._coordinator.register_sensor(self.unique_id, self)
+        _LOGGER.info(f"JackeryHome sensor {self.unique_id} registered to coordinator")
 
     async def async_will_remove_from_hass(self) -> None:
         """传感器从 Home Assistant 移除时，从协调器注销."""
         # 从协调器注销
-        self._coordinator.unregister_sensor(self._sensor_id)
-        _LOGGER.info(f"JackeryHome sensor {self._sensor_id} unregistered from coordinator")
+        self._coordinator.unregister_sensor(self.unique_id)
+        _LOGGER.info(f"JackeryHome sensor {self.unique_id} unregistered from coordinator")
         
         await super().async_will_remove_from_hass()
 
@@ -532,4 +644,5 @@ class JackeryHomeSensor(SensorEntity):
             "sensor_id": self._sensor_id,
             "meter_sn": self._meter_sn,
             "device_sn": self._coordinator._device_sn,
+            "dev_sn": self.dev_sn,
         }
\ No newline at end of file